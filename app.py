@@ -1,19 +1,27 @@
 import streamlit as st
 import pandas as pd
 import os
-import base64
+import math
+import fitz  # PyMuPDF
 from modules.email_client import SmarterMailClient
 from modules.ocr_engine import OCREngine
-from modules.ai_processor import extract_invoice_data
-from modules.database import init_db, save_invoice, get_all_invoices
+from modules.database import (
+    init_db, get_change_counter, get_invoice_summary, get_invoices_page
+)
+from modules.pipeline import process_file
 
 # ---------------------------------------------------------
 # Configuration
 # ---------------------------------------------------------
 st.set_page_config(page_title="Invoice Automator MVP", layout="wide")
 
-# Initialize Database
-init_db()
+PAGE_SIZES = [25, 50, 100]
+STATUS_OPTIONS = {
+    "Todos": None,
+    "✅ OK": "ok",
+    "⚠️ Pendente": "pending",
+    "🔁 Duplicada": "duplicate",
+}
 
 # ---------------------------------------------------------
 # Resource Caching
@@ -22,20 +30,66 @@ init_db()
 def get_ocr_engine():
     return OCREngine()
 
+@st.cache_resource
+def ensure_db():
+    # Initialize Database once per server process instead of on every rerun
+    init_db()
+    return True
+
+# Query results are keyed on the DB change counter, so reruns (selection,
+# pagination) hit the cache and new/updated invoices invalidate it. Entries for
+# old counters are never hit again, so the cache is bounded and expires.
+@st.cache_data(show_spinner=False, max_entries=32, ttl=600)
+def load_summary(change_counter, search, status):
+    return get_invoice_summary(search, status)
+
+@st.cache_data(show_spinner=False, max_entries=64, ttl=600)
+def load_page(change_counter, page, page_size, search, status):
+    return get_invoices_page((page - 1) * page_size, page_size, search, status)
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def render_pdf_preview(file_path, mtime, page=0, zoom=1.5):
+    """Renders one page of a PDF to PNG bytes. mtime invalidates the entry if the file changes."""
+    with fitz.open(file_path) as doc:
+        pix = doc.load_page(min(page, doc.page_count - 1)).get_pixmap(matrix=fitz.Matrix(zoom, zoom))
+        return pix.tobytes("png"), doc.page_count
+
+ensure_db()
+
 # ---------------------------------------------------------
 # UI Helper Functions
 # ---------------------------------------------------------
 def display_pdf(file_path):
-    """Displays a PDF file in Streamlit using an iframe."""
+    """Displays cached page images of the PDF, one page at a time, instead of inlining the whole file."""
     if not os.path.exists(file_path):
         st.error("Arquivo não encontrado.")
         return
 
-    with open(file_path, "rb") as f:
-        base64_pdf = base64.b64encode(f.read()).decode('utf-8')
-    
-    pdf_display = f'<iframe src="data:application/pdf;base64,{base64_pdf}" width="100%" height="600" type="application/pdf"></iframe>'
-    st.markdown(pdf_display, unsafe_allow_html=True)
+    try:
+        mtime = os.path.getmtime(file_path)
+        # Page 1 is always rendered first; it also tells how many pages there are
+        png_bytes, page_count = render_pdf_preview(file_path, mtime)
+        if page_count > 1:
+            # Keyed on the file, so selecting another invoice starts back at page 1
+            page = st.number_input(f"Página (de {page_count})", min_value=1, max_value=page_count, value=1,
+                                   step=1, key=f"pdf_page_{file_path}")
+            if page > 1:
+                png_bytes, _ = render_pdf_preview(file_path, mtime, page - 1)
+    except Exception as e:
+        st.error(f"Erro ao abrir arquivo: {e}")
+        return
+
+    st.image(png_bytes, use_container_width=True)
+
+def compute_status(df):
+    """Vectorized Status column: duplicates first, then missing CNPJ/valor."""
+    pending = df['valor_total'].isna() | df['cnpj_emitente'].isna()
+    duplicate = df['duplicate_of'].notna()
+    duplicate_label = "🔁 Duplicada (#" + df['duplicate_of'].astype("Int64").astype(str) + ")"
+
+    status = pd.Series("✅ OK", index=df.index)
+    status = status.mask(pending, "⚠️ Pendente")
+    return status.mask(duplicate, duplicate_label)
 
 # ---------------------------------------------------------
 # Sidebar & Processing Pipeline
@@ -66,17 +120,8 @@ if st.sidebar.button("🔄 Processar Novos E-mails"):
             downloaded_files = email_client.download_attachment(msg_id)
             
             for f_path in downloaded_files:
-                # 4. OCR
-                status_text.text(f"Extraindo texto: {os.path.basename(f_path)}...")
-                raw_text = ocr.extract_text(f_path)
-                
-                # 5. AI Extraction
-                status_text.text(f"Processando com AI...")
-                invoice_data = extract_invoice_data(raw_text)
-                
-                if invoice_data:
-                    # 6. Save to DB
-                    save_invoice(invoice_data, f_path)
+                # 4. OCR -> Duplicate check -> AI Extraction -> Save to DB
+                process_file(ocr, f_path, on_status=status_text.text)
             
             progress_bar.progress(int((i + 1) / total * 100))
         
@@ -89,23 +134,30 @@ if st.sidebar.button("🔄 Processar Novos E-mails"):
 # ---------------------------------------------------------
 st.title("📊 Invoice Processing Dashboard")
 
-# Fetch Data
-df = get_all_invoices()
+# Filters
+st.sidebar.markdown("---")
+st.sidebar.subheader("Filtros")
+search = st.sidebar.text_input("Buscar (emitente, CNPJ, número)").strip() or None
+status_filter = STATUS_OPTIONS[st.sidebar.selectbox("Status", list(STATUS_OPTIONS))]
+page_size = st.sidebar.selectbox("Notas por página", PAGE_SIZES)
+
+# Fetch Data (only the summary and the current page)
+change_counter = get_change_counter()
+total_count, total_value = load_summary(change_counter, search, status_filter)
 
 # Metrics
 col_m1, col_m2, col_m3 = st.columns(3)
-col_m1.metric("Total de Notas", len(df))
-total_value = df['valor_total'].sum() if not df.empty else 0.0
+col_m1.metric("Total de Notas", total_count)
 col_m2.metric("Valor Total (R$)", f"R$ {total_value:,.2f}")
 
 # Data Table with Selection
 st.subheader("Notas Fiscais Processadas")
 
-# Highlight rows with missing critical data (Visual Cue in generic table limits)
-# We can use Pandas Styler but for st.dataframe selection, it's safer to just pass the df
-# and maybe add a column 'Status'
-if not df.empty:
-    df['Status'] = df.apply(lambda x: '⚠️ Pendente' if (pd.isna(x['valor_total']) or pd.isna(x['cnpj_emitente'])) else '✅ OK', axis=1)
+if total_count:
+    total_pages = max(1, math.ceil(total_count / page_size))
+    page = st.number_input(f"Página (de {total_pages})", min_value=1, max_value=total_pages, value=1)
+    df = load_page(change_counter, page, page_size, search, status_filter).copy()
+    df['Status'] = compute_status(df)
     
     # Selection Mode
     event = st.dataframe(
@@ -149,6 +201,9 @@ if not df.empty:
             
             if pd.isna(cnpj) or pd.isna(val) or val == 0:
                 st.error("⚠️ Atenção: CNPJ ou Valor Total não identificados corretamente!")
+
+            if pd.notna(selected_row['duplicate_of']):
+                st.warning(f"🔁 Possível duplicata da nota #{int(selected_row['duplicate_of'])}. Dados copiados do original, IA não executada. Revise.")
             
             # Reconstruct JSON for display or fetch form DB fields
             data_preview = {
@@ -164,5 +219,7 @@ if not df.empty:
             # Optional: Allow Manual Correction (Bonus, not strictly required but helpful MVP feature)
             # st.text_input("Corrigir CNPJ", value=selected_row['cnpj_emitente']) ...
             
+elif search or status_filter:
+    st.info("Nenhuma nota corresponde aos filtros.")
 else:
     st.info("Nenhuma nota processada ainda. Use o menu lateral para iniciar.")
@@ -0,0 +1,39 @@
+import os
+import signal
+import argparse
+# Disable PaddleOCR update check
+os.environ["PADDLE_PDX_DISABLE_MODEL_SOURCE_CHECK"] = "True"
+
+from modules.database import init_db
+from modules.ingest import (
+    IngestDaemon, DROP_DIR, WORKERS, LLM_WORKERS, MAX_IN_FLIGHT, POLL_MIN_INTERVAL, POLL_MAX_INTERVAL
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless invoice ingest daemon (mailbox + drop folder).")
+    parser.add_argument("--drop-dir", default=DROP_DIR, help="Folder watched for PDFs/images")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="Max parallel OCR workers")
+    parser.add_argument("--llm-workers", type=int, default=LLM_WORKERS, help="Max parallel AI requests")
+    parser.add_argument("--max-in-flight", type=int, default=MAX_IN_FLIGHT, help="Max queued documents per stage")
+    parser.add_argument("--poll-min", type=float, default=POLL_MIN_INTERVAL, help="Min mailbox poll interval (s)")
+    parser.add_argument("--poll-max", type=float, default=POLL_MAX_INTERVAL, help="Max mailbox poll interval (s)")
+    args = parser.parse_args()
+
+    init_db()
+
+    daemon = IngestDaemon(
+        drop_dir=args.drop_dir,
+        workers=args.workers,
+        llm_workers=args.llm_workers,
+        max_in_flight=args.max_in_flight,
+        poll_min_interval=args.poll_min,
+        poll_max_interval=args.poll_max,
+    )
+    signal.signal(signal.SIGTERM, lambda signum, frame: daemon.stop_event.set())
+
+    print(f"Ingest daemon started (ocr<={args.workers}, ai<={args.llm_workers}, max in flight={args.max_in_flight}).")
+    daemon.run_forever()
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,7 @@ import os
 os.environ["PADDLE_PDX_DISABLE_MODEL_SOURCE_CHECK"] = "True"
 
 import fitz  # PyMuPDF
+import pandas as pd
 import qdarktheme
 from PyQt6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
@@ -16,12 +17,13 @@ from PyQt6.QtGui import QPixmap, QImage, QAction, QIcon, QColor
 
 from modules.email_client import SmarterMailClient
 from modules.ocr_engine import OCREngine
-from modules.ai_processor import extract_invoice_data
-from modules.database import init_db, save_invoice, get_all_invoices
+from modules.database import init_db, get_all_invoices
+from modules.pipeline import process_file
 
 # Constants
 STATUS_PENDING = "⚠️ Pendente"
 STATUS_OK = "✅ OK"
+STATUS_DUPLICATE = "🔁 Duplicada"
 
 class ProcessingWorker(QThread):
     progress_update = pyqtSignal(int)
@@ -56,14 +58,7 @@ class ProcessingWorker(QThread):
                 downloaded_files = email_client.download_attachment(msg_id)
 
                 for f_path in downloaded_files:
-                    self.status_update.emit(f"OCR: {os.path.basename(f_path)}")
-                    raw_text = ocr.extract_text(f_path)
-                    
-                    self.status_update.emit("Processando IA...")
-                    invoice_data = extract_invoice_data(raw_text)
-                    
-                    if invoice_data:
-                        save_invoice(invoice_data, f_path)
+                    process_file(ocr, f_path, on_status=self.status_update.emit)
                 
                 self.progress_update.emit(int((i + 1) / total * 100))
 
@@ -161,7 +156,7 @@ class InvoiceWindow(QMainWindow):
         self.data_layout = QVBoxLayout(data_frame)
         self.data_labels = {}
         
-        fields = ["CNPJ Emitente", "Nome Emitente", "Número Nota", "Data Emissão", "Valor Total", "Resumo Serviço"]
+        fields = ["CNPJ Emitente", "Nome Emitente", "Número Nota", "Data Emissão", "Valor Total", "Resumo Serviço", "Duplicata de"]
         for field in fields:
             lbl_title = QLabel(f"{field}:")
             lbl_title.setStyleSheet("font-weight: bold; color: #ddd;")
@@ -193,13 +188,17 @@ class InvoiceWindow(QMainWindow):
         for idx, row in self.df_invoices.iterrows():
             # Calculate Status
             val = row['valor_total']
+            duplicate_of = row['duplicate_of']
             formatted_val = f"R$ {val:,.2f}" if val is not None else "R$ 0,00"
-            if val is not None:
+            # Duplicates mirror the original's value, don't count them twice
+            if val is not None and pd.isna(duplicate_of):
                 total_val += val
                 
             status = STATUS_OK
             if val is None or row['cnpj_emitente'] is None:
                 status = STATUS_PENDING
+            if pd.notna(duplicate_of):
+                status = f"{STATUS_DUPLICATE} (#{int(duplicate_of)})"
             
             # ID
             self.table.setItem(idx, 0, QTableWidgetItem(str(row['id'])))
@@ -216,6 +215,9 @@ class InvoiceWindow(QMainWindow):
             item_status = QTableWidgetItem(status)
             if status == STATUS_PENDING:
                 item_status.setForeground(QColor("orange"))
+            elif status.startswith(STATUS_DUPLICATE):
+                item_status.setForeground(QColor("#29b6f6"))
+                item_status.setToolTip("Possível duplicata: dados copiados da nota original, IA não executada. Revise.")
             else:
                 item_status.setForeground(QColor("#00e676"))
             self.table.setItem(idx, 5, item_status)
@@ -244,6 +246,11 @@ class InvoiceWindow(QMainWindow):
         val = row_data['valor_total']
         self.data_labels["Valor Total"].setText(f"R$ {val:,.2f}" if val else "R$ 0,00")
         self.data_labels["Resumo Serviço"].setText(str(row_data['resumo_servico']))
+        duplicate_of = row_data['duplicate_of']
+        if pd.notna(duplicate_of):
+            self.data_labels["Duplicata de"].setText(f"⚠️ Nota #{int(duplicate_of)} (revisar)")
+        else:
+            self.data_labels["Duplicata de"].setText("---")
         
         # Display File
         f_path = row_data['file_path']
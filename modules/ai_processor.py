@@ -7,10 +7,17 @@ load_dotenv()
 
 OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434/api/generate")
 MODEL_NAME = "phi3:3.8b"
+OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", "60"))
 
-def extract_invoice_data(raw_text):
+def extract_invoice_data(raw_text, timeout=None, raise_on_timeout=False):
     """
     Sends raw OCR text to Ollama (Phi-3) to extract structured invoice data.
+
+    Args:
+        raw_text (str): OCR text of the invoice
+        timeout (float): Request timeout in seconds, defaults to OLLAMA_TIMEOUT
+        raise_on_timeout (bool): Re-raise requests.exceptions.Timeout instead of
+            returning None, so callers can tell an overloaded server from a bad answer
     """
     
     system_prompt = (
@@ -53,7 +60,7 @@ def extract_invoice_data(raw_text):
     print(f"Sending text to Ollama ({MODEL_NAME})...")
     
     try:
-        response = requests.post(OLLAMA_URL, json=payload, timeout=60)
+        response = requests.post(OLLAMA_URL, json=payload, timeout=timeout or OLLAMA_TIMEOUT)
         response.raise_for_status()
         
         result_json = response.json()
@@ -67,6 +74,11 @@ def extract_invoice_data(raw_text):
             print(f"Failed to parse JSON from LLM response: {generated_text}")
             return None
             
+    except requests.exceptions.Timeout as e:
+        if raise_on_timeout:
+            raise
+        print(f"Error connecting to Ollama: {e}")
+        return None
     except requests.exceptions.RequestException as e:
         print(f"Error connecting to Ollama: {e}")
         return None
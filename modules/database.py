@@ -2,6 +2,7 @@ import sqlite3
 import pandas as pd
 import os
 import json
+from modules.dedup import DEDUP_MAX_DISTANCE, FINGERPRINT_VERSION, NUM_BANDS, band_values, stored_distance
 
 DB_PATH = "data/invoices.db"
 
@@ -21,19 +22,78 @@ def init_db():
             valor_total REAL,
             resumo_servico TEXT,
             file_path TEXT,
-            processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            duplicate_of INTEGER
         )
     """)
+
+    # Migrate databases created before near-duplicate detection existed
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(invoices)")]
+    if "duplicate_of" not in columns:
+        cursor.execute("ALTER TABLE invoices ADD COLUMN duplicate_of INTEGER")
+
+    # SimHash fingerprints of OCR text, split into bands for indexed lookup
+    band_columns = ", ".join(f"band{i} INTEGER NOT NULL" for i in range(NUM_BANDS))
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS invoice_fingerprints (
+            invoice_id INTEGER PRIMARY KEY,
+            simhash INTEGER NOT NULL,
+            numbers_hash INTEGER NOT NULL,
+            version INTEGER NOT NULL DEFAULT 1,
+            {band_columns}
+        )
+    """)
+    # Fingerprints stored before versioning are version 1
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(invoice_fingerprints)")]
+    if "version" not in columns:
+        cursor.execute("ALTER TABLE invoice_fingerprints ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+    for i in range(NUM_BANDS):
+        cursor.execute(
+            f"CREATE INDEX IF NOT EXISTS idx_fingerprints_band{i} ON invoice_fingerprints (band{i})"
+        )
+
+    # Mailbox messages already handed to the ingest daemon, kept across restarts
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS seen_messages (
+            message_id TEXT PRIMARY KEY,
+            seen_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # Paginated dashboard queries sort by processed_at
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_invoices_processed_at ON invoices (processed_at)")
+
+    # Change counter bumped by triggers on every write, so UIs can cache
+    # query results and only refetch when the invoices table actually changed
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS db_meta (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            change_counter INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    cursor.execute("INSERT OR IGNORE INTO db_meta (id, change_counter) VALUES (1, 0)")
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_invoices_{event.lower()}_counter
+            AFTER {event} ON invoices
+            BEGIN
+                UPDATE db_meta SET change_counter = change_counter + 1 WHERE id = 1;
+            END
+        """)
     conn.commit()
     conn.close()
 
-def save_invoice(data_dict, file_path):
+def save_invoice(data_dict, file_path, duplicate_of=None):
     """
     Saves the extracted invoice data and file path to the database.
     
     Args:
         data_dict (dict): Dictionary containing invoice data
         file_path (str): Path to the saved PDF/Image file
+        duplicate_of (int): ID of the invoice this file is a near-duplicate of, if any
+
+    Returns:
+        int: ID of the inserted invoice
     """
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
@@ -47,8 +107,9 @@ def save_invoice(data_dict, file_path):
             data_emissao, 
             valor_total, 
             resumo_servico, 
-            file_path
-        ) VALUES (?, ?, ?, ?, ?, ?, ?)
+            file_path,
+            duplicate_of
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
     """, (
         data_dict.get('cnpj_emitente'),
         data_dict.get('nome_emitente'),
@@ -56,11 +117,164 @@ def save_invoice(data_dict, file_path):
         data_dict.get('data_emissao'),
         data_dict.get('valor_total'),
         data_dict.get('resumo_servico'),
-        file_path
+        file_path,
+        duplicate_of
     ))
+    invoice_id = cursor.lastrowid
     
     conn.commit()
     conn.close()
+    return invoice_id
+
+def update_invoice_file_path(invoice_id, file_path):
+    """Points an invoice at its file's new location after it was moved."""
+    conn = sqlite3.connect(DB_PATH)
+    conn.execute("UPDATE invoices SET file_path = ? WHERE id = ?", (file_path, invoice_id))
+    conn.commit()
+    conn.close()
+
+def find_invoice_by_file_path(file_path):
+    """Returns the ID of the latest invoice saved from file_path, or None."""
+    conn = sqlite3.connect(DB_PATH)
+    row = conn.execute(
+        "SELECT id FROM invoices WHERE file_path = ? ORDER BY id DESC LIMIT 1", (file_path,)
+    ).fetchone()
+    conn.close()
+    return row[0] if row else None
+
+def get_seen_messages():
+    """Returns the set of mailbox message IDs already downloaded."""
+    conn = sqlite3.connect(DB_PATH)
+    rows = conn.execute("SELECT message_id FROM seen_messages").fetchall()
+    conn.close()
+    return {row[0] for row in rows}
+
+def mark_message_seen(message_id):
+    conn = sqlite3.connect(DB_PATH)
+    conn.execute("INSERT OR IGNORE INTO seen_messages (message_id) VALUES (?)", (message_id,))
+    conn.commit()
+    conn.close()
+
+def get_invoice(invoice_id):
+    """Returns a single invoice as a dict, or None if it does not exist."""
+    conn = sqlite3.connect(DB_PATH)
+    conn.row_factory = sqlite3.Row
+    row = conn.execute("SELECT * FROM invoices WHERE id = ?", (invoice_id,)).fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+def save_fingerprint(invoice_id, fingerprint):
+    """
+    Stores the OCR text fingerprint of an invoice.
+
+    Args:
+        invoice_id (int): ID of the invoice
+        fingerprint (tuple): (simhash, numbers_hash) from dedup.fingerprint_text
+    """
+    simhash, numbers_hash = fingerprint
+    bands = band_values(simhash)
+    band_names = ", ".join(f"band{i}" for i in range(NUM_BANDS))
+    placeholders = ", ".join("?" * (NUM_BANDS + 4))
+
+    conn = sqlite3.connect(DB_PATH)
+    conn.execute(
+        f"INSERT OR REPLACE INTO invoice_fingerprints (invoice_id, simhash, numbers_hash, version, {band_names}) "
+        f"VALUES ({placeholders})",
+        (invoice_id, simhash, numbers_hash, FINGERPRINT_VERSION, *bands)
+    )
+    conn.commit()
+    conn.close()
+
+def find_near_duplicate(fingerprint, max_distance=DEDUP_MAX_DISTANCE):
+    """
+    Looks up the stored invoice whose fingerprint is closest to the given one.
+    Only fingerprints of the current FINGERPRINT_VERSION are compared.
+
+    Returns:
+        tuple: (invoice_id, distance) of the best match within max_distance, or None
+    """
+    simhash, numbers_hash = fingerprint
+    conn = sqlite3.connect(DB_PATH)
+    if max_distance < NUM_BANDS:
+        # Pigeonhole: a match within max_distance bits shares at least one exact band
+        where = " OR ".join(f"band{i} = ?" for i in range(NUM_BANDS))
+        rows = conn.execute(
+            f"SELECT invoice_id, simhash FROM invoice_fingerprints "
+            f"WHERE version = ? AND numbers_hash = ? AND ({where})",
+            (FINGERPRINT_VERSION, numbers_hash, *band_values(simhash))
+        ).fetchall()
+    else:
+        rows = conn.execute(
+            "SELECT invoice_id, simhash FROM invoice_fingerprints WHERE version = ? AND numbers_hash = ?",
+            (FINGERPRINT_VERSION, numbers_hash)
+        ).fetchall()
+    conn.close()
+
+    best = None
+    for invoice_id, candidate in rows:
+        distance = stored_distance(simhash, candidate)
+        if distance <= max_distance and (best is None or distance < best[1]):
+            best = (invoice_id, distance)
+    return best
+
+# SQL conditions matching the Status column shown in the GUIs
+STATUS_FILTERS = {
+    "ok": "duplicate_of IS NULL AND valor_total IS NOT NULL AND cnpj_emitente IS NOT NULL",
+    "pending": "duplicate_of IS NULL AND (valor_total IS NULL OR cnpj_emitente IS NULL)",
+    "duplicate": "duplicate_of IS NOT NULL",
+}
+
+def get_change_counter():
+    """Returns a counter that increases on every write to the invoices table."""
+    conn = sqlite3.connect(DB_PATH)
+    row = conn.execute("SELECT change_counter FROM db_meta WHERE id = 1").fetchone()
+    conn.close()
+    return row[0] if row else 0
+
+def _build_filters(search=None, status=None):
+    clauses, params = [], []
+    if status:
+        clauses.append(f"({STATUS_FILTERS[status]})")
+    if search:
+        like = f"%{search}%"
+        clauses.append("(nome_emitente LIKE ? OR cnpj_emitente LIKE ? OR numero_nota LIKE ?)")
+        params.extend([like, like, like])
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    return where, params
+
+def get_invoice_summary(search=None, status=None):
+    """
+    Returns (count, total_value) of the invoices matching the filters.
+    Duplicates are counted but their value is not summed twice.
+    """
+    where, params = _build_filters(search, status)
+    conn = sqlite3.connect(DB_PATH)
+    count, total = conn.execute(f"""
+        SELECT COUNT(*), COALESCE(SUM(CASE WHEN duplicate_of IS NULL THEN valor_total END), 0)
+        FROM invoices {where}
+    """, params).fetchone()
+    conn.close()
+    return count, total
+
+def get_invoices_page(offset, limit, search=None, status=None):
+    """
+    Returns one page of invoices as a pandas DataFrame, newest first.
+
+    Args:
+        offset (int): Number of rows to skip
+        limit (int): Page size
+        search (str): Optional substring matched against emitente, CNPJ and número
+        status (str): Optional key of STATUS_FILTERS
+    """
+    where, params = _build_filters(search, status)
+    conn = sqlite3.connect(DB_PATH)
+    df = pd.read_sql_query(
+        f"SELECT * FROM invoices {where} ORDER BY processed_at DESC, id DESC LIMIT ? OFFSET ?",
+        conn,
+        params=[*params, limit, offset]
+    )
+    conn.close()
+    return df
 
 def get_all_invoices():
     """Returns all invoices as a pandas DataFrame."""
@@ -0,0 +1,123 @@
+import os
+import re
+import hashlib
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Maximum Hamming distance (out of 64 bits) for two documents to be
+# considered near-duplicates. Re-scans of the same invoice usually differ
+# by a few bits due to OCR noise. Unrelated layouts sit well above 15, but
+# monthly invoices from the same supplier can be as close as 4 bits: the
+# SimHash alone cannot tell them apart, only numbers_hash does.
+DEDUP_MAX_DISTANCE = int(os.getenv("DEDUP_MAX_DISTANCE", "6"))
+
+# Bumped whenever the text fed to fingerprint_text changes (OCR line order,
+# pages covered), since fingerprints of different versions are not comparable.
+# 1: raw PaddleOCR line order, all pages. 2: reading order, first page only.
+FINGERPRINT_VERSION = 2
+
+SIMHASH_BITS = 64
+BAND_BITS = 8
+NUM_BANDS = SIMHASH_BITS // BAND_BITS
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def _tokenize(text):
+    """Lowercases the OCR text and splits it into word tokens, dropping 1-char noise."""
+    return [t for t in _TOKEN_RE.findall(text.lower()) if len(t) > 1]
+
+
+def _to_signed64(value):
+    """SQLite INTEGER is signed 64-bit; store fingerprints in two's complement."""
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _from_signed64(value):
+    return value + (1 << 64) if value < 0 else value
+
+
+def _features(tokens):
+    """Yields word unigrams and bigrams; bigrams keep some of the word order."""
+    for i, token in enumerate(tokens):
+        yield token
+        if i + 1 < len(tokens):
+            yield f"{token} {tokens[i + 1]}"
+
+
+def _hash64(feature):
+    return int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def compute_simhash(text):
+    """
+    Computes a 64-bit SimHash fingerprint of the OCR text.
+    Returns None if the text has no usable tokens.
+    """
+    tokens = _tokenize(text or "")
+    if not tokens:
+        return None
+
+    weights = [0] * SIMHASH_BITS
+    for feature in _features(tokens):
+        h = _hash64(feature)
+        for bit in range(SIMHASH_BITS):
+            if h >> bit & 1:
+                weights[bit] += 1
+            else:
+                weights[bit] -= 1
+
+    fingerprint = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count("1")
+
+
+def split_bands(fingerprint):
+    """
+    Splits a fingerprint into NUM_BANDS integer bands.
+    If two fingerprints differ in at most NUM_BANDS - 1 bits, at least one band
+    matches exactly, so the bands can be used as indexed lookup keys.
+    """
+    mask = (1 << BAND_BITS) - 1
+    return [(fingerprint >> (i * BAND_BITS)) & mask for i in range(NUM_BANDS)]
+
+
+def compute_numbers_hash(text):
+    """
+    Hashes the set of numeric tokens (invoice number, CNPJ, dates, values).
+
+    Monthly invoices from the same supplier share almost all of their text and
+    may fall within DEDUP_MAX_DISTANCE of each other, so a SimHash match is only
+    accepted when the numbers agree exactly as well. An OCR misread in a digit
+    makes the check fail, which just sends the document through the LLM.
+    """
+    numbers = sorted({t for t in _tokenize(text or "") if t.isdigit() and len(t) > 2})
+    return _hash64("|".join(numbers))
+
+
+def fingerprint_text(text):
+    """
+    Returns (simhash, numbers_hash) for the OCR text as SQLite-safe signed
+    integers, or None if the text has no usable tokens.
+    """
+    simhash = compute_simhash(text)
+    if simhash is None:
+        return None
+    return _to_signed64(simhash), _to_signed64(compute_numbers_hash(text))
+
+
+def band_values(stored_simhash):
+    """Splits a stored (signed) SimHash into its band lookup keys."""
+    return split_bands(_from_signed64(stored_simhash))
+
+
+def stored_distance(a, b):
+    """Hamming distance between two stored (signed) SimHash values."""
+    return hamming_distance(_from_signed64(a), _from_signed64(b))
@@ -63,6 +63,21 @@ class SmarterMailClient:
         print("Searching for unseen invoices...")
         return ["msg-001", "msg-002"]
 
+    def mark_as_read(self, message_id):
+        """
+        Flags a message as read so it no longer matches search_unseen_invoices.
+        Endpoint: POST /MarkRead
+        """
+        url = f"{self.base_url}/MarkRead"
+        headers = {"Authorization": f"Bearer {self.token}"}
+        payload = {"ids": [message_id], "folder": "Inbox"}
+
+        # Real call:
+        # response = requests.post(url, json=payload, headers=headers)
+        # response.raise_for_status()
+
+        print(f"Marked {message_id} as read.")
+
     def download_attachment(self, message_id):
         """
         Fetches message details, finds PDF attachment, decodes Base64, and saves it.
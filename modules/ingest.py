@@ -0,0 +1,329 @@
+import os
+import time
+import random
+import shutil
+import threading
+from dotenv import load_dotenv
+from modules.database import (
+    update_invoice_file_path, find_invoice_by_file_path, get_seen_messages, mark_message_seen,
+)
+from modules.email_client import SmarterMailClient
+from modules.scheduler import AdaptiveScheduler
+
+try:
+    # watchdog uses inotify on Linux (FSEvents/ReadDirectoryChangesW elsewhere)
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+load_dotenv()
+
+DROP_DIR = os.getenv("INGEST_DROP_DIR", "inbox")
+# Files waiting for or going through OCR/AI. Rescanned on startup, so nothing
+# queued when the daemon stops is lost.
+PROCESSING_DIR = os.getenv("INGEST_PROCESSING_DIR", "processing")
+# Failed files are retried in-process with exponential backoff (RETRY_DELAY,
+# 2x, 4x, ...) and moved to FAILED_DIR after MAX_ATTEMPTS for manual review
+FAILED_DIR = os.getenv("INGEST_FAILED_DIR", "failed")
+MAX_ATTEMPTS = int(os.getenv("INGEST_MAX_ATTEMPTS", "3"))
+RETRY_DELAY = float(os.getenv("INGEST_RETRY_DELAY", "30"))
+POLL_MIN_INTERVAL = float(os.getenv("INGEST_POLL_MIN_INTERVAL", "15"))
+POLL_MAX_INTERVAL = float(os.getenv("INGEST_POLL_MAX_INTERVAL", "300"))
+MAX_IN_FLIGHT = int(os.getenv("INGEST_MAX_IN_FLIGHT", "4"))
+WORKERS = int(os.getenv("INGEST_WORKERS", "1"))
+LLM_WORKERS = int(os.getenv("INGEST_LLM_WORKERS", "2"))
+
+SUPPORTED_EXTENSIONS = (".pdf", ".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp")
+
+# A dropped file is picked up once its size was unchanged for STABLE_CHECKS
+# checks STABLE_CHECK_INTERVAL seconds apart, so files still being copied are
+# not read half-written. Files that never settle are left in the drop directory.
+STABLE_CHECK_INTERVAL = 0.5
+STABLE_CHECKS = 3
+STABLE_TIMEOUT = 60
+
+
+class _DropDirHandler(FileSystemEventHandler):
+    def __init__(self, daemon):
+        self.daemon = daemon
+
+    # Runs on watchdog's single event thread: only record the path, the
+    # pickup thread does the waiting and the (blocking) submission
+    def on_created(self, event):
+        if not event.is_directory:
+            self.daemon.note_dropped(event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.daemon.note_dropped(event.dest_path)
+
+
+class IngestDaemon:
+    """
+    Headless ingest loop: polls the mailbox and watches a drop directory,
+    feeding documents to an AdaptiveScheduler as they arrive.
+
+    The scheduler's queues are bounded (max_in_flight), so when the OCR/AI
+    workers fall behind the mailbox poller and the drop-folder pickup thread
+    block instead of downloading or accepting more work. The watchdog event
+    thread itself never blocks.
+    """
+
+    def __init__(self, drop_dir=DROP_DIR, workers=WORKERS, llm_workers=LLM_WORKERS,
+                 max_in_flight=MAX_IN_FLIGHT,
+                 poll_min_interval=POLL_MIN_INTERVAL, poll_max_interval=POLL_MAX_INTERVAL,
+                 processing_dir=PROCESSING_DIR, failed_dir=FAILED_DIR,
+                 max_attempts=MAX_ATTEMPTS, retry_delay=RETRY_DELAY):
+        self.drop_dir = drop_dir
+        self.processing_dir = processing_dir
+        self.failed_dir = failed_dir
+        self.max_attempts = max(1, max_attempts)
+        self.retry_delay = retry_delay
+        self.poll_min_interval = poll_min_interval
+        self.poll_max_interval = poll_max_interval
+        self.scheduler = AdaptiveScheduler(
+            max_ocr=max(1, workers),
+            max_llm=max(1, llm_workers),
+            max_queued=max_in_flight,
+            on_done=self._on_done,
+        )
+        self.stop_event = self.scheduler.stop_event
+        self.email_client = SmarterMailClient()
+        self.seen_messages = get_seen_messages()
+        self._dropped_lock = threading.Lock()
+        self._dropped_pending = {}  # path -> [last size, stable checks, first seen]
+        self._retry_lock = threading.Lock()
+        self._attempts = {}  # path -> failed attempts so far
+        self._retry_timers = set()
+        self._threads = []
+        self._observer = None
+        os.makedirs(self.drop_dir, exist_ok=True)
+        os.makedirs(self.processing_dir, exist_ok=True)
+        os.makedirs(self.failed_dir, exist_ok=True)
+
+    # -----------------------------------------------------
+    # Submission
+    # -----------------------------------------------------
+    def submit(self, file_path):
+        """Enqueues a file for processing, blocking while the scheduler is full."""
+        return self.scheduler.submit(file_path)
+
+    def _stage(self, file_path, name):
+        """Moves a file into the processing folder and enqueues it from there."""
+        dest = os.path.join(self.processing_dir, name)
+        shutil.move(file_path, dest)
+        self.submit(dest)
+        return dest
+
+    def note_dropped(self, path):
+        """Records a file seen in the drop directory; _pickup_loop stages it once it stops growing."""
+        if not path.lower().endswith(SUPPORTED_EXTENSIONS):
+            return
+        with self._dropped_lock:
+            self._dropped_pending.setdefault(path, [-1, 0, time.monotonic()])
+
+    def _settled_dropped(self):
+        """
+        Checks the size of every pending dropped file once and returns those
+        that settled. All pending files are checked together, so a burst of
+        drops waits for the slowest copy, not for the sum of them.
+        """
+        settled, now = [], time.monotonic()
+        with self._dropped_lock:
+            for path, state in list(self._dropped_pending.items()):
+                try:
+                    size = os.path.getsize(path)
+                except OSError:
+                    del self._dropped_pending[path]  # moved away or deleted
+                    continue
+                state[1] = state[1] + 1 if size == state[0] and size > 0 else 0
+                state[0] = size
+                if state[1] >= STABLE_CHECKS:
+                    settled.append(path)
+                    del self._dropped_pending[path]
+                elif now - state[2] > STABLE_TIMEOUT:
+                    print(f"{path} is still changing after {STABLE_TIMEOUT}s, leaving it in {self.drop_dir}.")
+                    del self._dropped_pending[path]
+        return settled
+
+    def _stage_dropped(self, path):
+        """
+        Moves a file from the drop directory into the processing folder and
+        enqueues it. It only reaches the download folder once it was saved,
+        see _on_done.
+        """
+        try:
+            name, ext = os.path.splitext(os.path.basename(path))
+            dest = self._stage(path, f"drop_{name}_{int(time.time())}{ext.lower()}")
+            print(f"Picked up dropped file: {path} -> {dest}")
+        except OSError as e:
+            print(f"Error picking up dropped file {path}: {e}")
+
+    # -----------------------------------------------------
+    # Threads
+    # -----------------------------------------------------
+    def _on_done(self, file_path, invoice_id):
+        if invoice_id is None:
+            self._retry_or_fail(file_path)
+            return
+        with self._retry_lock:
+            self._attempts.pop(file_path, None)
+        dest = os.path.join(self.email_client.download_folder, os.path.basename(file_path))
+        try:
+            shutil.move(file_path, dest)
+            update_invoice_file_path(invoice_id, dest)
+        except OSError as e:
+            print(f"Error moving {file_path} to {dest}: {e}")
+            return
+        print(f"Processed {dest} -> invoice {invoice_id}")
+
+    def _retry_or_fail(self, file_path):
+        """Schedules another attempt with exponential backoff, or gives up after max_attempts."""
+        with self._retry_lock:
+            attempts = self._attempts.get(file_path, 0) + 1
+            if attempts < self.max_attempts and not self.stop_event.is_set():
+                self._attempts[file_path] = attempts
+                delay = self.retry_delay * 2 ** (attempts - 1)
+                timer = threading.Timer(delay, self._retry, (file_path,))
+                timer.daemon = True
+                self._retry_timers.add(timer)
+                timer.start()
+                print(f"Failed to process {file_path} (attempt {attempts}/{self.max_attempts}), retrying in {delay:.0f}s.")
+                return
+            self._attempts.pop(file_path, None)
+
+        if attempts < self.max_attempts:
+            # Stopping: the file stays in the processing folder for the next start
+            print(f"Failed to process {file_path}, kept for retry on next start.")
+            return
+        dest = os.path.join(self.failed_dir, os.path.basename(file_path))
+        try:
+            shutil.move(file_path, dest)
+        except OSError as e:
+            print(f"Error moving {file_path} to {dest}: {e}")
+            return
+        print(f"Giving up on {file_path} after {attempts} attempts, moved to {dest}.")
+
+    def _retry(self, file_path):
+        with self._retry_lock:
+            self._retry_timers.discard(threading.current_thread())  # runs on the Timer's own thread
+        if not self.stop_event.is_set():
+            self.submit(file_path)
+
+    def _resume_processing(self, paths):
+        """
+        Re-enqueues files left in the processing folder by a previous run.
+        Files already saved (the daemon stopped between saving and moving
+        them) are only moved, not processed again as duplicates of themselves.
+        """
+        for path in paths:
+            invoice_id = find_invoice_by_file_path(path)
+            if invoice_id is not None:
+                print(f"{path} was already saved as invoice {invoice_id}, finishing the move.")
+                self._on_done(path, invoice_id)
+                continue
+            print(f"Resuming {path}")
+            self.submit(path)
+
+    def _poll_mailbox_loop(self):
+        """
+        Polls the mailbox on an adaptive interval: back to the minimum when
+        something arrives, growing by 1.5x while the mailbox is idle, and
+        doubling on errors up to the maximum. Each wait is jittered by +-20%.
+        """
+        interval = self.poll_min_interval
+        while not self.stop_event.is_set():
+            try:
+                msg_ids = [m for m in self.email_client.search_unseen_invoices() if m not in self.seen_messages]
+                for msg_id in msg_ids:
+                    if self.stop_event.is_set():
+                        break
+                    # Downloads only happen when the queue has room (submit blocks)
+                    for f_path in self.email_client.download_attachment(msg_id):
+                        self._stage(f_path, os.path.basename(f_path))
+                    # Files are safe in the processing folder, don't download again
+                    mark_message_seen(msg_id)
+                    self.seen_messages.add(msg_id)
+                    self.email_client.mark_as_read(msg_id)
+
+                if msg_ids:
+                    interval = self.poll_min_interval
+                else:
+                    interval = min(interval * 1.5, self.poll_max_interval)
+            except Exception as e:
+                print(f"Mailbox poll failed: {e}")
+                self.email_client.token = None  # force re-login on next poll
+                interval = min(interval * 2, self.poll_max_interval)
+
+            # Jitter only the wait, so it doesn't accumulate into the interval
+            self.stop_event.wait(min(interval * random.uniform(0.8, 1.2), self.poll_max_interval))
+
+    def _pickup_loop(self):
+        """Stages dropped files as they settle; submit() may block here, never in watchdog."""
+        while not self.stop_event.wait(STABLE_CHECK_INTERVAL):
+            for path in self._settled_dropped():
+                if self.stop_event.is_set():
+                    break
+                self._stage_dropped(path)
+
+    def _scan_drop_dir(self):
+        for name in sorted(os.listdir(self.drop_dir)):
+            path = os.path.join(self.drop_dir, name)
+            if os.path.isfile(path):
+                self.note_dropped(path)
+
+    def _poll_drop_dir_loop(self, interval=5):
+        """Fallback when watchdog is not installed: rescan the drop directory."""
+        while not self.stop_event.is_set():
+            self._scan_drop_dir()
+            self.stop_event.wait(interval)
+
+    def _start_thread(self, target, name):
+        thread = threading.Thread(target=target, name=name, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    # -----------------------------------------------------
+    # Lifecycle
+    # -----------------------------------------------------
+    def start(self):
+        # Listed before the poller starts, so newly staged files aren't submitted twice
+        leftovers = [os.path.join(self.processing_dir, name) for name in sorted(os.listdir(self.processing_dir))]
+        leftovers = [path for path in leftovers if os.path.isfile(path)]
+        self._start_thread(lambda: self._resume_processing(leftovers), "resume-processing")
+        self._start_thread(self._poll_mailbox_loop, "mailbox-poller")
+        self._start_thread(self._pickup_loop, "drop-dir-pickup")
+
+        if Observer is not None:
+            # Files dropped while the daemon was down
+            self._scan_drop_dir()
+            self._observer = Observer()
+            self._observer.schedule(_DropDirHandler(self), self.drop_dir, recursive=False)
+            self._observer.start()
+            print(f"Watching {self.drop_dir} for new documents.")
+        else:
+            print("watchdog not installed, polling the drop directory instead.")
+            self._start_thread(self._poll_drop_dir_loop, "drop-dir-poller")
+
+    def stop(self):
+        self.scheduler.stop()
+        with self._retry_lock:
+            for timer in self._retry_timers:
+                timer.cancel()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+        for thread in self._threads:
+            thread.join(timeout=5)
+
+    def run_forever(self):
+        self.start()
+        try:
+            while not self.stop_event.wait(1):
+                pass
+        except KeyboardInterrupt:
+            print("Stopping ingest daemon...")
+        finally:
+            self.stop()
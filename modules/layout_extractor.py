@@ -0,0 +1,206 @@
+import re
+import unicodedata
+from collections import defaultdict
+import numpy as np
+
+# OCR lines below this confidence are not trusted as field values
+MIN_VALUE_SCORE = 0.6
+
+# Fields that must all be resolved from the layout for the LLM to be skipped
+LAYOUT_REQUIRED_FIELDS = ("cnpj_emitente", "nome_emitente", "numero_nota", "data_emissao", "valor_total")
+
+# Label patterns, matched against accent-stripped lowercase text.
+# The first label occurrence in reading order wins: on NFS-e forms the
+# prestador (emitente) block comes before the tomador block.
+FIELD_LABELS = {
+    "cnpj_emitente": [r"\bcpf\s*/\s*cnpj\b", r"\bcnpj\b"],
+    "nome_emitente": [r"\bnome\s*/\s*razao\s+social\b", r"\brazao\s+social\b"],
+    "numero_nota": [r"\bnumero\s+da\s+(nota|nfs-?e)\b", r"\bn[o°º]\.?\s+da\s+(nota|nfs-?e)\b"],
+    "data_emissao": [r"\bdata\s+(e\s+hora\s+)?(de\s+|da\s+)?emissao\b", r"^emissao\b"],
+    # "Valor Total das Deduções/dos Tributos/das Retenções" are other totals on the same form
+    "valor_total": [r"\bvalor\s+total(?!\s+d[aeo]s?\s+(deduc|tribut|retenc|iss|imposto))(\s+da\s+nota|\s+do\s+servico)?\b", r"\bvalor\s+da\s+nota\b", r"\bvalor\s+liquido\b"],
+    "resumo_servico": [r"\bdiscriminacao\s+dos?\s+servicos?\b", r"\bdescricao\s+dos?\s+servicos?\b"],
+}
+_LABEL_RES = {field: [re.compile(p) for p in patterns] for field, patterns in FIELD_LABELS.items()}
+_ANY_LABEL_RE = re.compile("|".join(p for patterns in FIELD_LABELS.values() for p in patterns))
+
+# Anchored on both sides so longer digit runs (e.g. the 44-digit NFS-e access
+# key, or an ungrouped "1500,00") are never matched partially
+_CNPJ_RE = re.compile(r"(?<!\d)\d{2}\.?\d{3}\.?\d{3}/?\d{4}-?\d{2}(?!\d)")
+# Thousands may be grouped with "." or a (non-breaking) space, or not at all
+_VALUE_RE = re.compile(r"(?<![\d.,])((?:\d{1,3}(?:[.\s\u00a0]\d{3})+|\d+),\d{2})(?![\d,])")
+_DATE_RE = re.compile(r"(\d{2})/(\d{2})/(\d{4})")
+_NUMBER_RE = re.compile(r"(?:n[o°º]\.?\s*)?(\d{1,15})", re.IGNORECASE)
+
+
+def _normalize(text):
+    """
+    Lowercases and strips accents. Also returns, for each normalized char,
+    its index in the original text, so matches can be mapped back.
+    """
+    chars, positions = [], []
+    for i, c in enumerate(text):
+        for d in unicodedata.normalize("NFKD", c.lower()):
+            if not unicodedata.combining(d):
+                chars.append(d)
+                positions.append(i)
+    return "".join(chars), positions
+
+
+def _parse_cnpj(text):
+    match = _CNPJ_RE.search(text)
+    return re.sub(r"\D", "", match.group()) if match else None
+
+
+def _parse_value(text):
+    match = _VALUE_RE.search(text)
+    return float(re.sub(r"[.\s\u00a0]", "", match.group(1)).replace(",", ".")) if match else None
+
+
+def _parse_total(text):
+    # A zero total is what deduction/tax boxes usually hold, never a real invoice
+    # total; leave the field unresolved so the LLM fills it in
+    value = _parse_value(text)
+    return value or None
+
+
+def _parse_date(text):
+    match = _DATE_RE.search(text)
+    if not match:
+        return None
+    day, month, year = match.groups()
+    return f"{year}-{month}-{day}"
+
+
+def _parse_number(text):
+    # The whole line must be the number, so dates/values next to the label are skipped
+    match = _NUMBER_RE.fullmatch(text.strip(" :-"))
+    return match.group(1) if match else None
+
+
+def _parse_text(text):
+    text = text.strip(" :-")
+    return text if len(text) >= 3 and re.search(r"[A-Za-zÀ-ÿ]", text) else None
+
+
+FIELD_PARSERS = {
+    "cnpj_emitente": _parse_cnpj,
+    "nome_emitente": _parse_text,
+    "numero_nota": _parse_number,
+    "data_emissao": _parse_date,
+    "valor_total": _parse_total,
+    "resumo_servico": _parse_text,
+}
+
+
+class SpatialIndex:
+    """
+    Uniform grid over the line boxes of a layout. Each box is registered in
+    every cell it overlaps, so a rectangle query only looks at nearby lines.
+    """
+
+    def __init__(self, boxes, pages, cell_size):
+        self.cell_size = max(float(cell_size), 1.0)
+        self.cells = defaultdict(list)
+        cells = np.floor(boxes / self.cell_size).astype(np.int64)
+        for idx, (cx0, cy0, cx1, cy1) in enumerate(cells):
+            for cx in range(cx0, cx1 + 1):
+                for cy in range(cy0, cy1 + 1):
+                    self.cells[(int(pages[idx]), cx, cy)].append(idx)
+
+    def query(self, page, x0, y0, x1, y1):
+        """Returns the sorted indices of lines whose cells overlap the rectangle."""
+        found = set()
+        for cx in range(int(np.floor(x0 / self.cell_size)), int(np.floor(x1 / self.cell_size)) + 1):
+            for cy in range(int(np.floor(y0 / self.cell_size)), int(np.floor(y1 / self.cell_size)) + 1):
+                found.update(self.cells.get((page, cx, cy), ()))
+        return np.fromiter(sorted(found), dtype=np.intp, count=len(found))
+
+
+def _neighbors(layout, index, label_idx, line_height):
+    """
+    Candidate value lines for a label: the closest line on the same row to
+    the right, then the closest line just below. Farther lines are never
+    considered, they belong to other fields.
+    """
+    x0, y0, x1, y1 = layout.boxes[label_idx]
+    page = int(layout.pages[label_idx])
+    candidates = index.query(page, x0 - line_height, y0 - line_height,
+                             x1 + 20 * line_height, y1 + 3 * line_height)
+    candidates = candidates[candidates != label_idx]
+    if not len(candidates):
+        return candidates
+
+    boxes = layout.boxes[candidates]
+    center_y = (y0 + y1) / 2
+    cand_center_y = (boxes[:, 1] + boxes[:, 3]) / 2
+
+    right = (boxes[:, 0] >= x1 - line_height / 2) & (np.abs(cand_center_y - center_y) <= line_height / 2)
+    below = (boxes[:, 1] >= y1 - line_height / 4) & (boxes[:, 0] < x1) & (boxes[:, 2] > x0 - line_height) & ~right
+
+    nearest = []
+    if right.any():
+        nearest.append(candidates[right][np.argmin(boxes[right, 0] - x1)])
+    if below.any():
+        # Vertical gap weighs more than horizontal misalignment
+        nearest.append(candidates[below][np.argmin(2 * (boxes[below, 1] - y1) + np.abs(boxes[below, 0] - x0))])
+    return np.asarray(nearest, dtype=np.intp)
+
+
+def extract_fields(layout):
+    """
+    Resolves invoice fields by pairing form labels ("Valor Total", "CNPJ", ...)
+    with the nearest value to their right or below. A field whose nearest
+    value is missing or unreadable is left out for the LLM to fill in.
+
+    Args:
+        layout (OCRLayout): OCR result with line boxes
+
+    Returns:
+        dict: Resolved fields only, in the same format as extract_invoice_data
+    """
+    if not len(layout):
+        return {}
+
+    heights = layout.boxes[:, 3] - layout.boxes[:, 1]
+    line_height = max(float(np.median(heights)), 1.0)
+    index = SpatialIndex(layout.boxes, layout.pages, cell_size=4 * line_height)
+    normalized = [_normalize(text) for text in layout.texts]
+    # Any "Something:" line is a label too, even for fields we do not extract
+    is_label = np.array([bool(_ANY_LABEL_RE.search(norm)) or norm.rstrip().endswith(":")
+                         for norm, _ in normalized])
+    order, _ = layout.reading_order()
+
+    fields = {}
+    for field, patterns in _LABEL_RES.items():
+        parse = FIELD_PARSERS[field]
+        for idx in order:
+            norm, positions = normalized[idx]
+            match = next((m for m in (p.search(norm) for p in patterns) if m), None)
+            if match is None:
+                continue
+
+            # Inline value on the label line itself, e.g. "Valor Total: R$ 1.500,00"
+            value = None
+            if match.end() < len(norm) and layout.scores[idx] >= MIN_VALUE_SCORE:
+                value = parse(layout.texts[idx][positions[match.end()]:])
+
+            if value is None:
+                for cand in _neighbors(layout, index, idx, line_height):
+                    if is_label[cand]:
+                        continue
+                    if layout.scores[cand] < MIN_VALUE_SCORE:
+                        # The value is there but unreadable: do not guess
+                        break
+                    value = parse(layout.texts[cand])
+                    if value is not None:
+                        break
+
+            if value is not None:
+                fields[field] = value
+                break
+    return fields
+
+
+def has_required_fields(fields):
+    return all(fields.get(field) not in (None, "", 0) for field in LAYOUT_REQUIRED_FIELDS)
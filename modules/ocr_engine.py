@@ -1,10 +1,28 @@
 from paddleocr import PaddleOCR
+import fitz  # PyMuPDF
+import numpy as np
 import os
 import logging
+from modules.ocr_layout import OCRLayout
 
 # Suppress PaddleOCR debug logging
 logging.getLogger("ppocr").setLevel(logging.ERROR)
 
+# Same rasterization PaddleOCR uses for PDFs: 2x zoom, 1x for pages that would exceed 2000 px
+PDF_ZOOM = 2.0
+PDF_MAX_SIDE = 2000
+
+
+def _rasterize(page):
+    """Renders a PDF page to a BGR uint8 array, the format PaddleOCR expects."""
+    zoom = PDF_ZOOM
+    if max(page.rect.width, page.rect.height) * zoom > PDF_MAX_SIDE:
+        zoom = 1.0
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+    image = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+    return np.ascontiguousarray(image[:, :, ::-1])
+
+
 class OCREngine:
     def __init__(self):
         # Instantiate PaddleOCR with requested parameters:
@@ -13,32 +31,61 @@ class OCREngine:
         print("Initializing PaddleOCR (this may take a moment)...")
         self.ocr = PaddleOCR(use_angle_cls=True, lang='pt', show_log=False)
 
-    def extract_text(self, file_path):
+    def iter_pages(self, file_path):
         """
-        Extracts text from a given PDF or Image file using PaddleOCR.
-        Returns a single concatenated string.
+        Rasterizes, OCRs and yields one page at a time as an OCRLayout.
+
+        Only the current page's image is alive at any point, so peak memory
+        does not grow with the page count. Closing the generator early (e.g.
+        breaking out of the loop) skips the remaining pages.
         """
         if not os.path.exists(file_path):
             raise FileNotFoundError(f"File not found: {file_path}")
 
         print(f"Running OCR on {file_path}...")
-        
-        # paddleocr's ocr method handles PDF paths natively in newer versions,
-        # but sometimes requires conversion. Assuming paddleocr supports the file.
-        # It typically returns a list of results.
-        result = self.ocr.ocr(file_path, cls=True)
-        
-        extracted_text = []
-        
+
         # PaddleOCR result structure: list of pages -> list of lines -> [box, (text, score)]
-        # Usually result is a list of lists.
-        if result:
-            for page in result:
-                if page:
-                    for line in page:
-                        # line structure: [ [[x1,y1],[x2,y2],[x3,y3],[x4,y4]], ('text', 0.99) ]
-                        text_content = line[1][0]
-                        extracted_text.append(text_content)
-        
-        full_text = "\n".join(extracted_text)
-        return full_text
+        if file_path.lower().endswith(".pdf"):
+            with fitz.open(file_path) as doc:
+                for page_index in range(doc.page_count):
+                    image = _rasterize(doc.load_page(page_index))
+                    result = self.ocr.ocr(image, cls=True)
+                    del image
+                    yield OCRLayout.from_paddle_page(result[0] if result else None, page_index)
+        else:
+            result = self.ocr.ocr(file_path, cls=True)
+            yield OCRLayout.from_paddle_page(result[0] if result else None, 0)
+
+    def extract_layout(self, file_path, stop_when=None):
+        """
+        Runs PaddleOCR on a PDF or Image file and keeps the box geometry and
+        confidence of every line.
+
+        Args:
+            file_path (str): Path to the PDF/Image file
+            stop_when (callable): Optional predicate called with each new
+                page's layout, in page order; OCR stops once it returns True.
+                Callers keep their own running state, so each page is only
+                looked at once.
+
+        Returns:
+            OCRLayout: Layout of the pages that were read
+        """
+        page_layouts = []
+        pages = self.iter_pages(file_path)
+        try:
+            for page_layout in pages:
+                page_layouts.append(page_layout)
+                if stop_when is not None and stop_when(page_layout):
+                    print(f"Stopping OCR of {file_path} early after {len(page_layouts)} page(s).")
+                    break
+        finally:
+            pages.close()
+        return OCRLayout.concat(page_layouts)
+
+    def extract_text(self, file_path):
+        """
+        Extracts text from a given PDF or Image file using PaddleOCR.
+        Returns a single string in reading order.
+        """
+        return self.extract_layout(file_path).reading_order_text()
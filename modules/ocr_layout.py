@@ -0,0 +1,96 @@
+import numpy as np
+
+class OCRLayout:
+    """
+    Compact OCR result: one entry per detected text line.
+
+    Attributes:
+        boxes (np.ndarray): float32 (N, 4) axis-aligned boxes as x0, y0, x1, y1
+        scores (np.ndarray): float32 (N,) recognition confidence
+        texts (np.ndarray): object (N,) recognized strings
+        pages (np.ndarray): int32 (N,) page index of each line
+    """
+
+    def __init__(self, boxes, scores, texts, pages):
+        self.boxes = boxes
+        self.scores = scores
+        self.texts = texts
+        self.pages = pages
+
+    def __len__(self):
+        return len(self.texts)
+
+    @classmethod
+    def empty(cls):
+        return cls(
+            np.zeros((0, 4), dtype=np.float32),
+            np.zeros(0, dtype=np.float32),
+            np.zeros(0, dtype=object),
+            np.zeros(0, dtype=np.int32),
+        )
+
+    @classmethod
+    def from_paddle_page(cls, page, page_index=0):
+        """Builds a layout from one page of PaddleOCR output: [[quad, (text, score)], ...]."""
+        if not page:
+            return cls.empty()
+        # line structure: [ [[x1,y1],[x2,y2],[x3,y3],[x4,y4]], ('text', 0.99) ]
+        quads = np.asarray([line[0] for line in page], dtype=np.float32)
+        boxes = np.concatenate([quads.min(axis=1), quads.max(axis=1)], axis=1)
+        scores = np.asarray([line[1][1] for line in page], dtype=np.float32)
+        texts = np.empty(len(page), dtype=object)
+        texts[:] = [line[1][0] for line in page]
+        pages = np.full(len(page), page_index, dtype=np.int32)
+        return cls(boxes, scores, texts, pages)
+
+    @classmethod
+    def concat(cls, layouts):
+        layouts = [layout for layout in layouts if len(layout)]
+        if not layouts:
+            return cls.empty()
+        return cls(
+            np.concatenate([layout.boxes for layout in layouts]),
+            np.concatenate([layout.scores for layout in layouts]),
+            np.concatenate([layout.texts for layout in layouts]),
+            np.concatenate([layout.pages for layout in layouts]),
+        )
+
+    def _rows(self):
+        """
+        Assigns each line a visual row id, numbered top to bottom across pages.
+        Lines whose vertical centers are within half a line height share a row.
+        """
+        heights = self.boxes[:, 3] - self.boxes[:, 1]
+        row_height = max(float(np.median(heights)) / 2, 1.0)
+        centers_y = (self.boxes[:, 1] + self.boxes[:, 3]) / 2
+
+        rows = np.empty(len(self), dtype=np.int32)
+        row, row_y, last_page = 0, None, None
+        for idx in np.lexsort((centers_y, self.pages)):
+            if last_page != self.pages[idx] or centers_y[idx] - row_y > row_height:
+                row += 1
+                row_y = centers_y[idx]
+                last_page = self.pages[idx]
+            rows[idx] = row
+        return rows
+
+    def reading_order(self):
+        """Returns (line indices in reading order, row id of each line)."""
+        if not len(self):
+            return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.int32)
+        rows = self._rows()
+        return np.lexsort((self.boxes[:, 0], rows)), rows
+
+    def reading_order_text(self):
+        """Joins lines in reading order: same-row lines with spaces, rows with newlines."""
+        order, rows = self.reading_order()
+        lines, current, current_row = [], [], None
+        for idx in order:
+            if rows[idx] != current_row and current:
+                lines.append(" ".join(current))
+                current = []
+            current_row = rows[idx]
+            current.append(self.texts[idx])
+        if current:
+            lines.append(" ".join(current))
+        return "\n".join(lines)
@@ -0,0 +1,112 @@
+import os
+from modules.ai_processor import extract_invoice_data
+from modules.database import save_invoice, get_invoice, save_fingerprint, find_near_duplicate
+from modules.dedup import fingerprint_text
+from modules.layout_extractor import extract_fields, has_required_fields
+
+
+def _noop(msg):
+    pass
+
+
+def save_extracted(invoice_data, fingerprint, file_path):
+    """Saves extracted invoice data and indexes its fingerprint for duplicate detection."""
+    invoice_id = save_invoice(invoice_data, file_path)
+    if fingerprint is not None:
+        save_fingerprint(invoice_id, fingerprint)
+    return invoice_id
+
+
+def run_ocr_stage(ocr, file_path, on_status=None):
+    """
+    OCR + duplicate check + layout extraction. Near-duplicates, and invoices
+    whose key fields were all resolved from the form layout, are saved right away.
+
+    Returns:
+        tuple: (raw_text, fingerprint, layout_fields, invoice_id, pages_read).
+        invoice_id is set when the file was already saved and the AI stage must
+        be skipped. pages_read is the number of pages actually OCR'd, which is
+        lower than the page count when OCR stopped early.
+    """
+    notify = on_status or _noop
+
+    notify(f"OCR: {os.path.basename(file_path)}")
+    # Pages are OCR'd one at a time; stop as soon as the key fields are on the form.
+    # Each page is extracted on its own and merged, earlier pages winning, so the
+    # work stays linear in the page count.
+    layout_fields, page_texts = {}, []
+
+    def on_page(page_layout):
+        page_texts.append(page_layout.reading_order_text())
+        for field, value in extract_fields(page_layout).items():
+            layout_fields.setdefault(field, value)
+        return has_required_fields(layout_fields)
+
+    layout = ocr.extract_layout(file_path, stop_when=on_page)
+    raw_text = layout.reading_order_text()
+
+    # Always fingerprint the first page only: how many pages were read depends
+    # on early stopping, and the same invoice must hash the same way every time
+    fingerprint = fingerprint_text(page_texts[0]) if page_texts else None
+    if fingerprint is not None:
+        match = find_near_duplicate(fingerprint)
+        if match:
+            original_id, distance = match
+            original = get_invoice(original_id)
+            if original:
+                print(f"{file_path} is a near-duplicate of invoice #{original_id} (distance {distance}), skipping AI.")
+                notify(f"Duplicata da nota #{original_id}")
+                return (raw_text, fingerprint, {}, save_invoice(original, file_path, duplicate_of=original_id),
+                        len(page_texts))
+
+    if has_required_fields(layout_fields):
+        print(f"{file_path}: all key fields found in the layout, skipping AI.")
+        return (raw_text, fingerprint, layout_fields, save_extracted(layout_fields, fingerprint, file_path),
+                len(page_texts))
+
+    return raw_text, fingerprint, layout_fields, None, len(page_texts)
+
+
+def run_ai_stage(raw_text, fingerprint, file_path, layout_fields=None, on_status=None, timeout=None,
+                 raise_on_timeout=False):
+    """
+    LLM extraction + save. Fields already resolved from the layout take
+    precedence over the LLM output; the LLM fills in the rest.
+
+    With raise_on_timeout, an Ollama timeout propagates as
+    requests.exceptions.Timeout and nothing is saved.
+
+    Returns:
+        int: ID of the saved invoice, or None if extraction failed
+    """
+    notify = on_status or _noop
+
+    notify("Processando IA...")
+    llm_data = extract_invoice_data(raw_text, timeout=timeout, raise_on_timeout=raise_on_timeout)
+    invoice_data = {**(llm_data or {}), **(layout_fields or {})}
+    if not invoice_data:
+        return None
+    return save_extracted(invoice_data, fingerprint, file_path)
+
+
+def process_file(ocr, file_path, on_status=None):
+    """
+    Runs a downloaded file through OCR -> duplicate check -> AI -> DB.
+
+    Near-duplicates of an invoice already in the database (e.g. a re-scanned
+    PDF resent by the supplier) skip the LLM stage: the original's data is
+    copied and the new row is linked to it via duplicate_of for review.
+    The LLM is also skipped when the layout extractor resolves every key field.
+
+    Args:
+        ocr (OCREngine): Initialized OCR engine
+        file_path (str): Path to the PDF/Image file
+        on_status (callable): Optional callback receiving status messages
+
+    Returns:
+        int: ID of the saved invoice, or None if extraction failed
+    """
+    raw_text, fingerprint, layout_fields, invoice_id, _ = run_ocr_stage(ocr, file_path, on_status)
+    if invoice_id is not None:
+        return invoice_id
+    return run_ai_stage(raw_text, fingerprint, file_path, layout_fields, on_status)
@@ -0,0 +1,295 @@
+import os
+import time
+import queue
+import itertools
+import threading
+import fitz  # PyMuPDF
+import requests
+from modules.ai_processor import OLLAMA_TIMEOUT
+from modules.ocr_engine import OCREngine
+from modules.pipeline import run_ocr_stage, run_ai_stage, save_extracted
+
+# Extra cost per MB, catches high-DPI scans and large images
+SIZE_COST_PER_MB = 0.2
+# LLM cost unit, in characters of OCR text
+LLM_CHARS_PER_COST = 2000
+# Aging: every this many seconds of waiting offsets one unit of cost, so large
+# documents are not starved by a steady stream of cheaper ones
+AGING_SECONDS_PER_COST = float(os.getenv("SCHEDULER_AGING_SECONDS", "10"))
+
+
+def estimate_cost(file_path):
+    """
+    Estimates the OCR cost of a document from its page count and file size.
+    Units are roughly "one page"; every page is rasterized and OCR'd, text
+    layer or not, so all pages cost the same.
+    """
+    try:
+        size_mb = os.path.getsize(file_path) / (1024 * 1024)
+    except OSError:
+        return 1.0
+
+    pages = 1
+    if file_path.lower().endswith(".pdf"):
+        try:
+            with fitz.open(file_path) as doc:
+                pages = max(1, doc.page_count)
+        except Exception as e:
+            print(f"Could not inspect {file_path} for cost estimation: {e}")
+
+    return pages + size_mb * SIZE_COST_PER_MB
+
+
+def estimate_llm_cost(raw_text):
+    return 1.0 + len(raw_text or "") / LLM_CHARS_PER_COST
+
+
+def aged_priority(cost, now=None):
+    """
+    Queue priority of a job (lower runs first): cost - waited / AGING_SECONDS_PER_COST.
+    The part common to all queued jobs ("now") is dropped, so it reduces to
+    cost + enqueue time / AGING_SECONDS_PER_COST and never has to be recomputed.
+    """
+    if now is None:
+        now = time.monotonic()
+    return cost + now / AGING_SECONDS_PER_COST
+
+
+class AdaptiveLimiter:
+    """
+    Concurrency limit adjusted from observed latencies (gradient/AIMD style).
+
+    Latencies are normalized by job cost and smoothed with an EWMA. While the
+    smoothed value stays close to the best seen so far (the baseline) and the
+    limit is saturated, the limit grows by one; when it rises above
+    baseline * tolerance (and by more than min_delta seconds, to ignore jitter
+    on very fast jobs), the stage is overloaded and the limit shrinks by a
+    quarter. A congestion signal (e.g. a timeout) halves it.
+
+    on_limit_change, if given, is called with the new limit (under the lock).
+    """
+
+    def __init__(self, name, minimum=1, maximum=4, initial=1, tolerance=2.0, alpha=0.3, min_delta=0.5,
+                 on_limit_change=None):
+        self.name = name
+        self.on_limit_change = on_limit_change or (lambda limit: None)
+        self.minimum = minimum
+        self.maximum = max(minimum, maximum)
+        self.limit = min(max(initial, minimum), self.maximum)
+        self.tolerance = tolerance
+        self.alpha = alpha
+        self.min_delta = min_delta
+        self.active = 0
+        self.ewma = None
+        self.baseline = None
+        self._cond = threading.Condition()
+
+    def acquire(self, timeout=None):
+        """Waits for a free slot. Returns False on timeout."""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.active < self.limit, timeout=timeout):
+                return False
+            self.active += 1
+            return True
+
+    def release(self, latency=None, cost=1.0, congested=False, backlog=True):
+        """
+        Frees a slot; pass latency/cost to feed the adaptation. backlog tells
+        whether work is waiting; the limit only grows when it is.
+        """
+        with self._cond:
+            saturated = self.active >= self.limit and backlog
+            self.active -= 1
+
+            if congested:
+                self._congest()
+            elif latency is not None:
+                previous = self.limit
+                self._observe(latency / max(cost, 0.1), saturated)
+                if self.limit != previous:
+                    self.on_limit_change(self.limit)
+
+            self._cond.notify_all()
+
+    def signal_congestion(self):
+        """Halves the limit without giving up the caller's slot (e.g. before a retry)."""
+        with self._cond:
+            self._congest()
+
+    def _congest(self):
+        previous = self.limit
+        self.limit = max(self.minimum, self.limit // 2)
+        print(f"[{self.name}] congestion, limit -> {self.limit}")
+        if self.limit != previous:
+            self.on_limit_change(self.limit)
+
+    def _observe(self, sample, saturated):
+        self.ewma = sample if self.ewma is None else self.alpha * sample + (1 - self.alpha) * self.ewma
+        # Let the baseline drift up slowly so it can recover from a lucky outlier
+        self.baseline = sample if self.baseline is None else min(self.baseline * 1.01, sample)
+
+        previous = self.limit
+        if self.ewma > self.baseline * self.tolerance and self.ewma - self.baseline > self.min_delta:
+            self.limit = max(self.minimum, int(self.limit * 0.75))
+        elif saturated:
+            self.limit = min(self.maximum, self.limit + 1)
+        if self.limit != previous:
+            print(f"[{self.name}] latency {self.ewma:.1f}s/unit (baseline {self.baseline:.1f}), limit -> {self.limit}")
+
+
+class AdaptiveScheduler:
+    """
+    Two-stage (OCR -> AI) scheduler for incoming documents.
+
+    - Shortest-job-first with aging: both stages use priority queues ordered by
+      estimated cost minus time waited (see AGING_SECONDS_PER_COST), so a
+      40-page scan does not hold up one-page invoices, yet still runs eventually.
+    - Adaptive concurrency: each stage has an AdaptiveLimiter fed by observed
+      latencies; LLM timeouts count as congestion. Worker threads (and their
+      OCR engines) are only started as the limit grows.
+    - Backpressure: both queues are bounded. When the AI queue is full, OCR
+      workers block handing off their result; the OCR queue then fills up
+      and submit() blocks, stalling the download stage.
+    """
+
+    def __init__(self, max_ocr=2, max_llm=2, max_queued=4, on_done=None):
+        self.ocr_queue = queue.PriorityQueue(maxsize=max(1, max_queued))
+        self.llm_queue = queue.PriorityQueue(maxsize=max(1, max_queued))
+        self.ocr_limiter = AdaptiveLimiter("ocr", maximum=max_ocr, on_limit_change=lambda limit: self._grow("ocr", limit))
+        self.llm_limiter = AdaptiveLimiter("llm", maximum=max_llm, on_limit_change=lambda limit: self._grow("llm", limit))
+        self.on_done = on_done or (lambda file_path, invoice_id: None)
+        self.stop_event = threading.Event()
+        self._seq = itertools.count()  # FIFO tie-break for equal priorities
+        self._threads = []
+        self._workers = {"ocr": [], "llm": []}
+        self._workers_lock = threading.Lock()
+        self._grow("ocr", self.ocr_limiter.limit)
+        self._grow("llm", self.llm_limiter.limit)
+
+    def _grow(self, stage, limit):
+        """
+        Starts workers until the stage has `limit` of them. Workers are never
+        stopped when the limit shrinks, they just wait for a slot, so memory
+        is bounded by the highest limit actually reached, not by the maximum.
+        """
+        target = self._ocr_loop if stage == "ocr" else self._llm_loop
+        with self._workers_lock:
+            workers = self._workers[stage]
+            while len(workers) < limit:
+                thread = threading.Thread(target=target, name=f"{stage}-worker-{len(workers)}", daemon=True)
+                thread.start()
+                workers.append(thread)
+                self._threads.append(thread)
+
+    def _put(self, q, item):
+        """Blocking put that gives up when the scheduler stops."""
+        while not self.stop_event.is_set():
+            try:
+                q.put(item, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def submit(self, file_path):
+        """Queues a document for processing, blocking while the OCR queue is full."""
+        cost = estimate_cost(file_path)
+        return self._put(self.ocr_queue, (aged_priority(cost), next(self._seq), (cost, file_path)))
+
+    def _take(self, limiter, q):
+        """Reserves a stage slot, then takes the cheapest job. Returns None if idle."""
+        if not limiter.acquire(timeout=1):
+            return None
+        try:
+            return q.get(timeout=1)
+        except queue.Empty:
+            limiter.release()
+            return None
+
+    def _ocr_loop(self):
+        # PaddleOCR is not thread-safe; each worker loads its own engine on first use
+        engine = {}
+        while not self.stop_event.is_set():
+            job = self._take(self.ocr_limiter, self.ocr_queue)
+            if job is None:
+                continue
+            try:
+                self._run_ocr_job(engine, *job)
+            finally:
+                # Only after the hand-off, so join() never sees a gap between stages
+                self.ocr_queue.task_done()
+
+    def _run_ocr_job(self, engine, _priority, _seq, job):
+        _cost, file_path = job
+        try:
+            if "ocr" not in engine:
+                engine["ocr"] = OCREngine()
+            # Model loading is a one-off, keep it out of the latency sample
+            started = time.monotonic()
+            raw_text, fingerprint, layout_fields, invoice_id, pages_read = run_ocr_stage(engine["ocr"], file_path)
+        except Exception as e:
+            self.ocr_limiter.release()
+            print(f"OCR failed for {file_path}: {e}")
+            self.on_done(file_path, None)
+            return
+        # Normalize by the pages actually OCR'd, not the estimate: early stopping
+        # can read 1 page of 40, which would otherwise look 40x faster than usual
+        self.ocr_limiter.release(time.monotonic() - started, max(1, pages_read), backlog=not self.ocr_queue.empty())
+
+        if invoice_id is not None:
+            self.on_done(file_path, invoice_id)
+            return
+        llm_cost = estimate_llm_cost(raw_text)
+        self._put(self.llm_queue, (aged_priority(llm_cost), next(self._seq),
+                                   (llm_cost, file_path, raw_text, fingerprint, layout_fields)))
+
+    def _llm_loop(self):
+        while not self.stop_event.is_set():
+            job = self._take(self.llm_limiter, self.llm_queue)
+            if job is None:
+                continue
+            try:
+                self._run_llm_job(*job[2])
+            finally:
+                self.llm_queue.task_done()
+
+    def _run_llm_job(self, cost, file_path, raw_text, fingerprint, layout_fields):
+        # Longer texts get proportionally more time before we give up
+        timeout = OLLAMA_TIMEOUT * max(1.0, cost / 2)
+        invoice_id, latency, timed_out = self._run_ai(raw_text, fingerprint, layout_fields, file_path, timeout)
+        if timed_out:
+            # Signal congestion first so the retry runs with less contention. The
+            # slot is kept: re-acquiring it could starve behind idle workers.
+            self.llm_limiter.signal_congestion()
+            print(f"AI timed out for {file_path}, retrying once with {timeout * 2:.0f}s")
+            invoice_id, latency, timed_out = self._run_ai(raw_text, fingerprint, layout_fields, file_path, timeout * 2)
+        self.llm_limiter.release(None if timed_out else latency, cost, congested=timed_out,
+                                 backlog=not self.llm_queue.empty())
+
+        if timed_out and layout_fields:
+            # Keep what the layout gave us; the invoice shows as pending for review
+            invoice_id = save_extracted(layout_fields, fingerprint, file_path)
+        self.on_done(file_path, invoice_id)
+
+    def _run_ai(self, raw_text, fingerprint, layout_fields, file_path, timeout):
+        """Returns (invoice_id, latency, timed_out). Nothing is saved on timeout."""
+        started = time.monotonic()
+        invoice_id, timed_out = None, False
+        try:
+            invoice_id = run_ai_stage(raw_text, fingerprint, file_path, layout_fields,
+                                      timeout=timeout, raise_on_timeout=True)
+        except requests.exceptions.Timeout:
+            timed_out = True
+        except Exception as e:
+            print(f"AI stage failed for {file_path}: {e}")
+        return invoice_id, time.monotonic() - started, timed_out
+
+    def join(self):
+        """Waits until every submitted document has gone through both stages."""
+        self.ocr_queue.join()
+        self.llm_queue.join()
+
+    def stop(self):
+        self.stop_event.set()
+        for thread in self._threads:
+            thread.join(timeout=5)
@@ -0,0 +1,116 @@
+import sqlite3
+
+import pytest
+
+from modules import database
+from modules.dedup import (
+    FINGERPRINT_VERSION, NUM_BANDS, _from_signed64, _to_signed64, band_values, compute_numbers_hash,
+    compute_simhash, fingerprint_text, hamming_distance, split_bands,
+)
+
+MAX_DISTANCE = 6
+
+
+def invoice_text(number, date):
+    return f"""PREFEITURA DO MUNICIPIO DE SAO PAULO
+NOTA FISCAL DE SERVICOS ELETRONICA NFS-e
+Numero da Nota {number} Data e Hora de Emissao {date} 10:22:01
+PRESTADOR DE SERVICOS CPF/CNPJ 12.345.678/0001-90 Inscricao Municipal 1234567
+Nome/Razao Social ACME Consultoria Ltda Endereco Rua das Flores 100 Centro
+TOMADOR DE SERVICOS CPF/CNPJ 98.765.432/0001-10 Nome/Razao Social Cliente SA
+DISCRIMINACAO DOS SERVICOS Consultoria em TI referente a abril/2024
+VALOR TOTAL DA NOTA R$ 1.500,00 Codigo do Servico 01234 Aliquota 5,00%"""
+
+
+ORIGINAL = invoice_text("00012345", "01/05/2024")
+# Same document scanned again: a couple of OCR misreads in words, none in numbers
+RESCAN = ORIGINAL.replace("Consultoria Ltda", "Consu1toria Ltda").replace("Centro", "Cenlro")
+# Next month's invoice from the same supplier: same layout, different number and date
+NEXT_MONTH = invoice_text("00012399", "01/06/2024")
+UNRELATED = """Conta de energia eletrica CEMIG Distribuicao referencia marco unidade consumidora
+leitura anterior leitura atual consumo kWh bandeira tarifaria vermelha total a pagar vencimento"""
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "data" / "invoices.db"))
+    database.init_db()
+    return database
+
+
+def save(db, text):
+    invoice_id = db.save_invoice({"numero_nota": "1"}, "nota.pdf")
+    db.save_fingerprint(invoice_id, fingerprint_text(text))
+    return invoice_id
+
+
+def test_simhash_distance_near_and_far():
+    original = compute_simhash(ORIGINAL)
+
+    assert hamming_distance(original, compute_simhash(RESCAN)) <= 2
+    assert hamming_distance(original, compute_simhash(UNRELATED)) > 15
+
+
+def test_no_tokens_no_fingerprint():
+    assert compute_simhash("") is None
+    assert fingerprint_text(" - . ") is None
+
+
+@pytest.mark.parametrize("value", [0, 1, (1 << 63) - 1, 1 << 63, (1 << 64) - 1])
+def test_signed64_round_trip(value):
+    stored = _to_signed64(value)
+
+    assert -(1 << 63) <= stored < 1 << 63
+    assert _from_signed64(stored) == value
+    assert band_values(stored) == split_bands(value)
+
+
+def test_bands_cover_all_bits():
+    bands = split_bands(0x0123456789ABCDEF)
+
+    assert len(bands) == NUM_BANDS
+    assert sum(band << (8 * i) for i, band in enumerate(bands)) == 0x0123456789ABCDEF
+
+
+def test_rescan_is_found(db):
+    original_id = save(db, ORIGINAL)
+    save(db, UNRELATED)
+
+    match = db.find_near_duplicate(fingerprint_text(RESCAN), max_distance=MAX_DISTANCE)
+
+    assert match is not None
+    assert match[0] == original_id
+    assert match[1] <= 2
+
+
+def test_unrelated_is_not_found(db):
+    save(db, ORIGINAL)
+
+    assert db.find_near_duplicate(fingerprint_text(UNRELATED), max_distance=MAX_DISTANCE) is None
+
+
+def test_next_month_is_rejected_by_numbers_hash(db):
+    # Close enough for the SimHash alone to call it a duplicate...
+    assert hamming_distance(compute_simhash(ORIGINAL), compute_simhash(NEXT_MONTH)) <= MAX_DISTANCE
+    assert compute_numbers_hash(ORIGINAL) != compute_numbers_hash(NEXT_MONTH)
+    save(db, ORIGINAL)
+
+    # ...so it must be the numbers that keep it apart
+    assert db.find_near_duplicate(fingerprint_text(NEXT_MONTH), max_distance=MAX_DISTANCE) is None
+
+
+def test_full_scan_without_bands_finds_the_same_match(db):
+    original_id = save(db, ORIGINAL)
+
+    assert db.find_near_duplicate(fingerprint_text(RESCAN), max_distance=64)[0] == original_id
+
+
+def test_fingerprints_of_other_versions_are_ignored(db):
+    original_id = save(db, ORIGINAL)
+    conn = sqlite3.connect(db.DB_PATH)
+    conn.execute("UPDATE invoice_fingerprints SET version = ? WHERE invoice_id = ?",
+                 (FINGERPRINT_VERSION - 1, original_id))
+    conn.commit()
+    conn.close()
+
+    assert db.find_near_duplicate(fingerprint_text(ORIGINAL), max_distance=MAX_DISTANCE) is None
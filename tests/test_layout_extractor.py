@@ -0,0 +1,141 @@
+import pytest
+
+from modules.ocr_layout import OCRLayout
+from modules.layout_extractor import (
+    _parse_cnpj, _parse_value, _parse_date, _parse_number, _parse_text,
+    extract_fields, has_required_fields,
+)
+
+
+def line(x0, y0, x1, y1, text, score=0.95):
+    return [[[x0, y0], [x1, y0], [x1, y1], [x0, y1]], (text, score)]
+
+
+NFSE_PAGE = [
+    line(300, 20, 500, 40, "NOTA FISCAL DE SERVIÇOS ELETRÔNICA"),
+    line(20, 60, 160, 80, "Número da Nota"), line(20, 85, 100, 105, "00012345"),
+    line(200, 60, 380, 80, "Data e Hora de Emissão"), line(200, 85, 380, 105, "01/05/2024 10:22:01"),
+    line(20, 115, 700, 135, "Chave de Acesso: 35503082212345678000190000000000001234512345678"),
+    line(20, 140, 300, 160, "PRESTADOR DE SERVIÇOS"),
+    line(20, 170, 120, 190, "CPF/CNPJ:"), line(130, 170, 330, 190, "12.345.678/0001-90"),
+    line(400, 170, 520, 190, "Inscrição Municipal:"), line(530, 170, 600, 190, "1234567"),
+    line(20, 200, 500, 220, "Nome/Razão Social: ACME Consultoria Ltda"),
+    line(20, 260, 300, 280, "TOMADOR DE SERVIÇOS"),
+    line(20, 290, 120, 310, "CPF/CNPJ:"), line(130, 290, 330, 310, "98.765.432/0001-10"),
+    line(20, 320, 500, 340, "Nome/Razão Social: Cliente SA"),
+    line(20, 380, 400, 400, "DISCRIMINAÇÃO DOS SERVIÇOS"), line(20, 410, 500, 430, "Consultoria em TI - abril/2024"),
+    line(20, 480, 180, 500, "VALOR TOTAL DA NOTA"), line(190, 480, 300, 500, "R$ 1500,00"),
+]
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("R$ 1.500,00", 1500.0),
+    ("R$ 1500,00", 1500.0),
+    ("R$ 12345,67", 12345.67),
+    ("1 500,00", 1500.0),
+    ("1.234.567,89", 1234567.89),
+    ("Total: 0,99", 0.99),
+    ("1500", None),
+    ("12,345", None),
+])
+def test_parse_value(text, expected):
+    assert _parse_value(text) == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("12.345.678/0001-90", "12345678000190"),
+    ("CNPJ 12345678000190", "12345678000190"),
+    ("35503082212345678000190000000000001234512345678", None),
+    ("123456780001901", None),
+])
+def test_parse_cnpj(text, expected):
+    assert _parse_cnpj(text) == expected
+
+
+def test_parse_date_number_and_text():
+    assert _parse_date("01/05/2024 10:22:01") == "2024-05-01"
+    assert _parse_date("2024") is None
+    assert _parse_number(": 00012345") == "00012345"
+    assert _parse_number("Nº 987") == "987"
+    assert _parse_number("01/05/2024") is None
+    assert _parse_text(": ACME Ltda") == "ACME Ltda"
+    assert _parse_text("12") is None
+
+
+def test_extract_fields_pairs_labels_with_nearest_values():
+    fields = extract_fields(OCRLayout.from_paddle_page(NFSE_PAGE))
+
+    assert fields == {
+        "cnpj_emitente": "12345678000190",
+        "nome_emitente": "ACME Consultoria Ltda",
+        "numero_nota": "00012345",
+        "data_emissao": "2024-05-01",
+        "valor_total": 1500.0,
+        "resumo_servico": "Consultoria em TI - abril/2024",
+    }
+    assert has_required_fields(fields)
+
+
+def test_extract_fields_skips_low_confidence_values():
+    page = [line(20, 480, 180, 500, "Valor Total"), line(190, 480, 300, 500, "R$ 1500,00", score=0.3)]
+    fields = extract_fields(OCRLayout.from_paddle_page(page))
+
+    assert "valor_total" not in fields
+    assert not has_required_fields(fields)
+
+
+def test_extract_fields_empty_layout():
+    assert extract_fields(OCRLayout.empty()) == {}
+
+
+@pytest.mark.parametrize("text", [
+    "Valor Total das Deduções (R$) 0,00",
+    "Valor Total das Retenções 0,00",
+    "Valor Total dos Tributos: R$ 231,00",
+])
+def test_other_totals_are_not_the_invoice_total(text):
+    page = NFSE_PAGE[:-2] + [line(20, 450, 500, 470, text)]
+    fields = extract_fields(OCRLayout.from_paddle_page(page))
+
+    assert "valor_total" not in fields
+    assert not has_required_fields(fields)
+
+
+def test_deduction_total_before_invoice_total_is_skipped():
+    page = [line(20, 450, 500, 470, "Valor Total das Deduções (R$) 0,00")] + NFSE_PAGE
+
+    assert extract_fields(OCRLayout.from_paddle_page(page))["valor_total"] == 1500.0
+
+
+def test_zero_total_is_unresolved():
+    page = NFSE_PAGE[:-1] + [line(190, 480, 300, 500, "R$ 0,00")]
+    fields = extract_fields(OCRLayout.from_paddle_page(page))
+
+    assert "valor_total" not in fields
+    assert not has_required_fields({**fields, "valor_total": 0.0})
+
+
+def test_rps_number_is_not_the_invoice_number():
+    page = [line(20, 60, 160, 80, "Número do RPS"), line(20, 85, 100, 105, "777")]
+
+    assert "numero_nota" not in extract_fields(OCRLayout.from_paddle_page(page))
+
+
+def test_unreadable_value_leaves_field_unresolved():
+    page = [
+        line(20, 200, 200, 220, "Nome/Razão Social:"), line(210, 200, 400, 220, "ACME Consult0ria", score=0.3),
+        line(450, 200, 600, 220, "Inscrição Municipal:"),
+        line(20, 230, 300, 250, "Endereço: Rua das Flores, 100"),
+    ]
+
+    assert "nome_emitente" not in extract_fields(OCRLayout.from_paddle_page(page))
+
+
+def test_missing_value_does_not_borrow_other_lines():
+    page = [
+        line(20, 200, 200, 220, "Nome/Razão Social"),
+        line(20, 230, 120, 250, "Endereço:"), line(130, 230, 400, 250, "Rua das Flores, 100"),
+        line(20, 260, 300, 280, "Município: São Paulo"),
+    ]
+
+    assert "nome_emitente" not in extract_fields(OCRLayout.from_paddle_page(page))
@@ -0,0 +1,119 @@
+import heapq
+
+import pytest
+
+from modules.scheduler import AdaptiveLimiter, aged_priority, AGING_SECONDS_PER_COST
+
+
+def run_job(limiter, latency, cost=1.0, backlog=True):
+    assert limiter.acquire(timeout=0)
+    limiter.release(latency, cost, backlog=backlog)
+
+
+def test_limit_grows_when_saturated_with_backlog():
+    changes = []
+    limiter = AdaptiveLimiter("t", maximum=3, on_limit_change=changes.append)
+
+    run_job(limiter, 1.0)
+    assert limiter.limit == 2
+
+    # Only grows again once both slots are busy
+    assert limiter.acquire(timeout=0)
+    run_job(limiter, 1.0)
+    assert limiter.limit == 3
+    assert changes == [2, 3]
+
+    assert limiter.acquire(timeout=0)  # still holding the first one: 3 busy below
+    run_job(limiter, 1.0)
+    assert limiter.limit == 3  # capped at maximum
+
+
+def test_limit_does_not_grow_without_backlog_or_saturation():
+    limiter = AdaptiveLimiter("t", maximum=3)
+    run_job(limiter, 1.0, backlog=False)
+    assert limiter.limit == 1
+
+    limiter = AdaptiveLimiter("t", maximum=3, initial=2)
+    run_job(limiter, 1.0)  # one of two slots busy: not saturated
+    assert limiter.limit == 2
+
+
+def test_limit_shrinks_when_latency_rises_above_baseline():
+    limiter = AdaptiveLimiter("t", maximum=4, initial=4)
+    run_job(limiter, 1.0)
+    run_job(limiter, 10.0)  # ewma 3.7 > 2 * baseline, and by more than min_delta
+
+    assert limiter.limit == 3
+
+
+def test_latency_is_normalized_by_cost():
+    limiter = AdaptiveLimiter("t", maximum=4, initial=4)
+    run_job(limiter, 1.0)
+    run_job(limiter, 10.0, cost=10)
+
+    assert limiter.limit == 4
+    assert limiter.baseline == pytest.approx(1.0)
+
+
+def test_small_absolute_jitter_is_ignored():
+    limiter = AdaptiveLimiter("t", maximum=4, initial=4)
+    run_job(limiter, 0.01)
+    run_job(limiter, 0.2)  # 20x slower, but only 0.2 s
+
+    assert limiter.limit == 4
+
+
+def test_congestion_halves_the_limit_down_to_minimum():
+    changes = []
+    limiter = AdaptiveLimiter("t", maximum=8, initial=8, on_limit_change=changes.append)
+
+    assert limiter.acquire(timeout=0)
+    limiter.release(congested=True)
+    assert limiter.limit == 4
+
+    for _ in range(3):
+        assert limiter.acquire(timeout=0)
+        limiter.release(congested=True)
+    assert limiter.limit == 1
+    assert changes == [4, 2, 1]
+
+
+def test_signal_congestion_keeps_the_slot():
+    limiter = AdaptiveLimiter("t", maximum=4, initial=4)
+    assert limiter.acquire(timeout=0)
+
+    limiter.signal_congestion()
+
+    assert limiter.limit == 2
+    assert limiter.active == 1
+
+
+def test_acquire_times_out_when_full():
+    limiter = AdaptiveLimiter("t", maximum=1)
+    assert limiter.acquire(timeout=0)
+    assert not limiter.acquire(timeout=0.01)
+
+    limiter.release()
+    assert limiter.acquire(timeout=0)
+
+
+def test_cheaper_jobs_run_first():
+    queue = []
+    heapq.heappush(queue, (aged_priority(5.0, now=100.0), "large"))
+    heapq.heappush(queue, (aged_priority(1.0, now=100.0), "small"))
+
+    assert heapq.heappop(queue)[1] == "small"
+
+
+def test_waiting_jobs_age_ahead_of_newer_cheaper_ones():
+    queue = []
+    heapq.heappush(queue, (aged_priority(5.0, now=0.0), "large"))
+    # Waited long enough to offset its extra 4 units of cost
+    later = 4 * AGING_SECONDS_PER_COST + 1
+    heapq.heappush(queue, (aged_priority(1.0, now=later), "small"))
+
+    assert heapq.heappop(queue)[1] == "large"
+
+    # A newer small job that arrives sooner still goes first
+    heapq.heappush(queue, (aged_priority(1.0, now=1.0), "early small"))
+    assert heapq.heappop(queue)[1] == "early small"